@@ -1,30 +1,419 @@
-import fsspec
-from fsspec.implementations.github import GithubFileSystem
 import argparse
+import collections
+import contextlib
+import functools
+import json
 import sys
 import os
 import logging
+import re
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import requests
 
-def verify_branch_exists(org, repo, branch, token=None):
+# orjson parses large API responses (e.g. a monorepo's recursive tree)
+# several times faster than the standard library, when it is installed.
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
+# Maximum number of file contents fetched from GitHub concurrently.
+MAX_WORKERS = 16
+
+# (connect, read) timeout in seconds for GitHub API requests, as used by
+# fsspec's GithubFileSystem, so a stalled connection fails instead of hanging.
+REQUEST_TIMEOUT = (60, 60)
+
+# Directories skipped by default when listing a repository: VCS metadata,
+# installed dependencies and bytecode caches never belong in a crawl. Names
+# like 'build' or 'dist' are left out, as packages often use them for source.
+DEFAULT_EXCLUDE_DIRS = frozenset({'.git', 'node_modules', '__pycache__'})
+
+# Number of files read per GitHub GraphQL query when a token is available.
+GRAPHQL_BATCH_SIZE = 100
+
+# Crawls of the whole repository selecting more than this many files, and at
+# least half of the repository's bytes, download the repository tarball in one
+# request instead of reading files one by one.
+TARBALL_THRESHOLD = 50
+
+# Git LFS files are stored as pointer files starting with this line; archives
+# and GraphQL return the pointer, not the file it points to.
+_LFS_POINTER_PREFIX = b"version https://git-lfs.github.com/"
+_LFS_POINTER_TEXT = _LFS_POINTER_PREFIX.decode()
+
+# Stands in for the contents of a file GitHub reports as binary, so it can be
+# skipped without being downloaded.
+_BINARY = object()
+
+# Buffer size for the --output file, so large crawls reach the disk in few
+# write syscalls.
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# Resolved commit SHAs are cached in memory and on disk for this many seconds.
+REF_CACHE_TTL = 600
+# Location of the cache file; if None, it is kept in the user's cache directory.
+REF_CACHE_PATH = None
+
+# In-process ref cache: (org, repo, ref, token) -> (sha, time resolved).
+_resolved_refs = {}
+
+def resolve_ref(org, repo, ref, token=None, use_cache=True):
+    """
+    Resolves a branch, tag or commit in the specified GitHub repository to
+    the SHA of its commit by querying the GitHub API. Raises a ValueError if
+    the ref does not exist.
+
+    Results are cached for REF_CACHE_TTL seconds, in memory and on disk, so
+    repeated crawls of the same ref skip the API call. With use_cache=False
+    neither cache is read, so a branch that just moved resolves to its new
+    commit; the fresh SHA is still written back to both.
+    """
+    # A full commit SHA needs no lookup.
+    if re.fullmatch(r"[0-9a-f]{40}", ref):
+        return ref
+
+    memo_key = (org, repo, ref, token)
+    if use_cache:
+        memo = _resolved_refs.get(memo_key)
+        if memo and time.time() - memo[1] < REF_CACHE_TTL:
+            return memo[0]
+
+    key = f"{org}/{repo}:{ref}"
+    cache = _load_ref_cache()
+    cached = cache.get(key)
+    if use_cache and cached and time.time() - cached["time"] < REF_CACHE_TTL:
+        _resolved_refs[memo_key] = cached["sha"], cached["time"]
+        return cached["sha"]
+
+    # The sha media type makes GitHub return just the SHA instead of the
+    # full commit, including its diff.
+    url = f"https://api.github.com/repos/{org}/{repo}/commits/{ref}"
+    headers = {**_auth_headers(token), "Accept": "application/vnd.github.sha"}
+    response = _session().get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    if response.status_code != 200:
+        raise ValueError(f"Branch '{ref}' does not exist in repository '{org}/{repo}'.")
+    sha = response.text.strip()
+
+    now = time.time()
+    _resolved_refs[memo_key] = sha, now
+    cache[key] = {"sha": sha, "time": now}
+    _save_ref_cache(cache)
+    return sha
+
+def _ref_cache_path():
+    """
+    Returns the path of the on-disk ref cache, or None if there is nowhere
+    to keep it.
+    """
+    if REF_CACHE_PATH is not None:
+        return Path(REF_CACHE_PATH)
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if not cache_home:
+        try:
+            cache_home = Path.home() / ".cache"
+        except (RuntimeError, KeyError):
+            # The home directory cannot be determined (e.g. HOME is unset and
+            # the user has no passwd entry): Python 3.10+ raises RuntimeError,
+            # older versions a KeyError from pwd.getpwuid.
+            return None
+    return Path(cache_home) / "repo_crawler" / "refs.json"
+
+def _load_ref_cache():
+    path = _ref_cache_path()
+    if path is None:
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_ref_cache(cache):
+    path = _ref_cache_path()
+    if path is None:
+        return
+    # Drop expired entries so the cache file does not grow without bound.
+    now = time.time()
+    cache = {k: v for k, v in cache.items() if now - v["time"] < REF_CACHE_TTL}
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+    except OSError as e:
+        logging.debug(f"Could not write ref cache {path}: {e}")
+
+@functools.lru_cache(maxsize=None)
+def _session():
+    """
+    Returns the requests.Session shared by every GitHub API call made by this
+    module, so connections are pooled and kept alive across requests.
+    Transient gateway errors are retried with exponential backoff.
     """
-    Verifies that the branch exists in the specified GitHub repository
-    by querying the GitHub API. Raises a ValueError if the branch does not exist.
+    # Imported here rather than at module level to keep CLI startup fast.
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    retry = Retry(total=5, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=retry)
+    session.mount("https://", adapter)
+    return session
+
+def _auth_headers(token=None):
+    """
+    Returns the request headers used to authenticate against the GitHub API.
     """
-    url = f"https://api.github.com/repos/{org}/{repo}/branches/{branch}"
     headers = {}
     if token:
         headers["Authorization"] = f"token {token}"
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        raise ValueError(f"Branch '{branch}' does not exist in repository '{org}/{repo}'.")
-    # If the branch exists, continue.
+    return headers
+
+def _get_tree(org, repo, tree_sha, token=None, recursive=False):
+    """
+    Fetches a single tree object from the Git Trees API.
+    """
+    url = f"https://api.github.com/repos/{org}/{repo}/git/trees/{tree_sha}"
+    params = {"recursive": "1"} if recursive else None
+    response = _session().get(url, headers=_auth_headers(token), params=params, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return _json_loads(response.content)
+
+def _list_tree(org, repo, ref, token=None, subdir="", exclude_dirs=frozenset(), excluded=None):
+    """
+    Lists every file under subdir in the repository tree at ref, returning
+    (path, sha, size) tuples in tree order. Paths are relative to the
+    repository root. Files inside any directory named in exclude_dirs
+    (below subdir) are left out; if a list is passed as excluded, the size of
+    each file left out is appended to it, or None for an excluded directory
+    whose contents were never listed.
+
+    The whole tree is fetched with a single recursive Git Trees API call. If
+    GitHub truncates that response, the tree is instead listed one level at a
+    time and each subtree is fetched recursively on its own, never descending
+    into excluded directories.
+    """
+    tree_sha = f"{ref}:{subdir}" if subdir else ref
+    prefix = f"{subdir}/" if subdir else ""
+    if excluded is None:
+        excluded = []
+    return _list_subtree(org, repo, tree_sha, token, prefix, exclude_dirs, excluded)
+
+def _list_subtree(org, repo, tree_sha, token, prefix, exclude_dirs, excluded):
+    tree = _get_tree(org, repo, tree_sha, token, recursive=True)
+    if not tree.get("truncated"):
+        files = []
+        for entry in tree["tree"]:
+            if entry["type"] != "blob":
+                continue
+            # Skip files with an excluded directory anywhere in their path.
+            if exclude_dirs and not exclude_dirs.isdisjoint(entry["path"].split('/')[:-1]):
+                excluded.append(entry["size"])
+                continue
+            files.append((prefix + entry["path"], entry["sha"], entry["size"]))
+        return files
+
+    files = []
+    for entry in _get_tree(org, repo, tree_sha, token)["tree"]:
+        path = prefix + entry["path"]
+        if entry["type"] == "blob":
+            files.append((path, entry["sha"], entry["size"]))
+        elif entry["type"] == "tree":
+            if entry["path"] in exclude_dirs:
+                excluded.append(None)
+            else:
+                files.extend(_list_subtree(org, repo, entry["sha"], token, f"{path}/", exclude_dirs, excluded))
+    return files
+
+def _fetch_blobs_graphql(org, repo, ref, paths, token):
+    """
+    Reads the text of up to GRAPHQL_BATCH_SIZE files in a single GitHub
+    GraphQL query, which costs one rate-limit point instead of one REST call
+    per file. Returns a list with the text of each path, in order; an entry
+    is _BINARY for a binary file, and None when GraphQL cannot return the
+    file (e.g. it is too large, or stored in Git LFS) and it must be read
+    through the REST API instead.
+    """
+    fields = "\n".join(
+        f"f{i}: object(expression: {json.dumps(f'{ref}:{path}')}) "
+        "{ ... on Blob { text isBinary isTruncated } }"
+        for i, path in enumerate(paths)
+    )
+    query = (
+        "query($owner: String!, $name: String!) "
+        f"{{ repository(owner: $owner, name: $name) {{ {fields} }} }}"
+    )
+    response = _session().post(
+        "https://api.github.com/graphql",
+        json={"query": query, "variables": {"owner": org, "name": repo}},
+        headers=_auth_headers(token),
+        timeout=REQUEST_TIMEOUT,
+    )
+    response.raise_for_status()
+    repository = _json_loads(response.content)["data"]["repository"]
+
+    texts = []
+    for i in range(len(paths)):
+        blob = repository.get(f"f{i}")
+        if blob and blob["isBinary"]:
+            texts.append(_BINARY)
+        elif not blob or blob["isTruncated"] or blob["text"].startswith(_LFS_POINTER_TEXT):
+            texts.append(None)
+        else:
+            texts.append(blob["text"])
+    return texts
+
+def _map_ordered(executor, fn, items):
+    """
+    Yields fn(item) for each item, in order, running the calls on the
+    executor. Unlike executor.map, only 2 * MAX_WORKERS calls are queued ahead
+    of the consumer, and the queued ones are cancelled if the consumer stops
+    early (e.g. the output pipe closes), so no further downloads start.
+    """
+    futures = collections.deque()
+    try:
+        for item in items:
+            futures.append(executor.submit(fn, item))
+            if len(futures) >= 2 * MAX_WORKERS:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+    finally:
+        for future in futures:
+            future.cancel()
 
-def crawl_repo_files(github_path, include_exts=None, exclude_exts=None, token=None, username=None, out=None, include_dir=None):
+def _read_files_graphql(org, repo, ref, paths, token, fetch, executor, include_binary=False):
     """
-    Recursively crawls a GitHub repository using fsspec's GithubFileSystem,
-    printing each file's content with a header and numbered lines.
+    Yields the (data, error) result for each path in order, reading file
+    contents in GraphQL batches. GraphQL returns text, so data is already
+    decoded for the files it serves; data is _BINARY for binary files, unless
+    include_binary is set. Files a batch cannot return, binary files when
+    include_binary is set, and whole batches whose query fails, are read with
+    fetch on the executor.
+    """
+    def read(item):
+        path, text = item
+        if text is None or (text is _BINARY and include_binary):
+            return fetch(path)
+        if text is _BINARY:
+            return _BINARY, None
+        return _normalize_newlines(text), None
+
+    for start in range(0, len(paths), GRAPHQL_BATCH_SIZE):
+        batch = paths[start:start + GRAPHQL_BATCH_SIZE]
+        try:
+            texts = _fetch_blobs_graphql(org, repo, ref, batch, token)
+        except Exception as e:
+            logging.debug(f"GraphQL read failed, falling back to REST: {e}")
+            texts = [None] * len(batch)
+
+        yield from _map_ordered(executor, read, zip(batch, texts))
+
+def _read_tarball(org, repo, ref, paths, token=None):
+    """
+    Streams the repository tarball at ref and yields (path, data) for each of
+    the given paths found in it, in archive order.
+    """
+    url = f"https://api.github.com/repos/{org}/{repo}/tarball/{ref}"
+    wanted = set(paths)
+    with _session().get(url, headers=_auth_headers(token), stream=True, timeout=REQUEST_TIMEOUT) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        with tarfile.open(fileobj=response.raw, mode='r|gz') as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                # Members are nested under a '<org>-<repo>-<sha>/' directory.
+                path = member.name.partition('/')[2]
+                if path in wanted:
+                    yield path, tar.extractfile(member).read()
+
+def _read_files_tarball(org, repo, ref, paths, token, fetch, executor):
+    """
+    Yields the (data, error) result for each path in order, reading file
+    contents from the repository tarball. Files missing from the archive
+    (e.g. export-ignore'd ones), Git LFS files, and every file not yet read if
+    the download fails, are read with fetch on the executor.
+
+    Files with export-subst attributes are printed as the archive expands
+    them, which the other readers do not do.
+    """
+    # Each archived path maps to its (data, error) result, or to None for Git
+    # LFS pointers, which are read with fetch when their turn comes.
+    results = {}
+    next_index = 0
+
+    def read(path):
+        result = results.pop(path, None)
+        return result if result is not None else fetch(path)
+
+    try:
+        for path, data in _read_tarball(org, repo, ref, paths, token):
+            results[path] = None if data.startswith(_LFS_POINTER_PREFIX) else (data, None)
+            # Archive order normally matches the tree listing, so files can be
+            # emitted as they arrive; anything out of order waits in results.
+            while next_index < len(paths) and paths[next_index] in results:
+                yield read(paths[next_index])
+                next_index += 1
+    except Exception as e:
+        logging.debug(f"Tarball read failed, falling back to REST: {e}")
+
+    yield from _map_ordered(executor, read, paths[next_index:])
+
+def _is_binary(data):
+    """
+    Returns True if file contents look binary, i.e. contain a NUL byte in
+    their first 8 KiB.
+    """
+    return b'\0' in data[:8192]
+
+def _normalize_newlines(text):
+    """
+    Converts CRLF and CR line endings to LF, as reading a file in text mode does.
+    """
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+def _format_numbered(text):
+    """
+    Returns text with every line prefixed by its 5-digit, zero-padded line
+    number, followed by a blank line.
+    """
+    lines = text.split('\n')
+    # A trailing newline ends the last line rather than starting a new one.
+    if lines[-1] == '':
+        lines.pop()
+        end = '\n\n'
+    else:
+        end = '\n'
+    if not lines:
+        return '\n'
+    return '\n'.join(map(str.__add__, _line_prefixes(len(lines)), lines)) + end
+
+# Line-number prefixes ('00001| ', '00002| ', ...) for the first lines of a
+# file, built once at import. The table is immutable, so threads can share it.
+_LINE_PREFIXES = tuple(f"{i:05d}| " for i in range(1, 4097))
+
+def _line_prefixes(count):
+    """
+    Returns line-number prefixes for at least count lines. Lines beyond the
+    shared table get prefixes built for this call only.
+    """
+    if count <= len(_LINE_PREFIXES):
+        return _LINE_PREFIXES
+    return _LINE_PREFIXES + tuple(f"{i:05d}| " for i in range(len(_LINE_PREFIXES) + 1, count + 1))
+
+def crawl_repo_files(github_path, include_exts=None, exclude_exts=None, token=None, username=None, out=None, include_dir=None, include_binary=False, exclude_dirs=DEFAULT_EXCLUDE_DIRS, ref_cache=True):
+    """
+    Recursively crawls a GitHub repository, printing each file's content with
+    a header and numbered lines. Files are listed with the Git Trees API.
+    Their contents are read from the repository tarball for large
+    whole-repository crawls, in GitHub GraphQL batches when a token is given,
+    and otherwise, as well as for any file those readers cannot return,
+    through fsspec's GithubFileSystem.
 
     The github_path can be provided in one of the following formats:
       1. github://<org>/<repo>/<branch>[/optional/path]
@@ -43,10 +432,22 @@ def crawl_repo_files(github_path, include_exts=None, exclude_exts=None, token=No
     :param out: A file-like object to write the output to. Defaults to sys.stdout.
     :param include_dir: If provided (e.g., "src"), the crawl is constrained to that directory
                         and all of its subdirectories.
+    :param include_binary: If True, print binary files (decoded as UTF-8 with replacement
+                           characters) instead of skipping them.
+    :param exclude_dirs: Directory names (e.g., ['node_modules']) whose contents are skipped
+                         wherever they appear below the crawled directory.
+                         Defaults to DEFAULT_EXCLUDE_DIRS.
+    :param ref_cache: If False, resolve the branch through the GitHub API even if its
+                      commit SHA is in the on-disk cache.
     """
     if out is None:
         out = sys.stdout
 
+    # GithubFileSystem is only created once a file is read through it, so
+    # check its credentials up front rather than failing on every file.
+    if (username is None) != (token is None):
+        raise ValueError("Auth required both username and token")
+
     # Parse the input path (supports various formats)
     if github_path.startswith("github://"):
         # Format: github://org/repo/branch[/optional/path]
@@ -81,16 +482,16 @@ def crawl_repo_files(github_path, include_exts=None, exclude_exts=None, token=No
     # Override subdir if --include_dir is specified.
     if include_dir is not None:
         subdir = include_dir
+    subdir = subdir.strip('/')
 
-    # Verify that the specified branch exists.
-    verify_branch_exists(org, repo, ref, token)
+    # Verify that the specified branch exists and resolve it to a commit SHA,
+    # so the listing and file reads below skip the ref lookup.
+    sha = resolve_ref(org, repo, ref, token, ref_cache)
 
-    fs = GithubFileSystem(org=org, repo=repo, sha=ref, token=token, username=username)
-
-    # Build the glob pattern for recursive search.
-    pattern = f"{subdir}/**" if subdir else "**"
+    # List every file under subdir with a single Git Trees API call.
+    excluded = []
     try:
-        all_paths = fs.glob(pattern, recursive=True)
+        entries = _list_tree(org, repo, sha, token, subdir, frozenset(exclude_dirs or ()), excluded)
     except Exception as e:
         raise ValueError(
             f"Failed to access branch '{ref}' in repository '{org}/{repo}'. "
@@ -98,47 +499,105 @@ def crawl_repo_files(github_path, include_exts=None, exclude_exts=None, token=No
         ) from e
 
     # If no files are found, assume the branch may be empty.
-    if not all_paths:
+    if not entries:
         raise ValueError(
             f"No files found in repository '{org}/{repo}' for branch '{ref}'. "
             "This may be because the branch does not exist or is empty."
         )
 
-    for path in all_paths:
-        try:
-            info = fs.info(path)
-        except Exception as e:
-            print(f"Could not get info for {path}: {e}", file=out)
-            continue
-
-        # Only process files (skip directories)
-        if info.get('type') != 'file':
-            continue
-
+    # Filter on extension before fetching anything, so skipped files cost
+    # no API calls. Sets make each membership test O(1).
+    include_exts = frozenset(include_exts or ())
+    exclude_exts = frozenset(exclude_exts or ())
+    check_ext = bool(include_exts or exclude_exts)
+    paths = []
+    sizes = []
+    for path, _sha, size in entries:
         # --- Filtering Logic ---
         # If include_exts is provided, only process files with these extensions.
         # Otherwise, if exclude_exts is provided, skip files with those extensions.
-        if include_exts:
-            parts_split = path.rsplit('.', 1)
-            if len(parts_split) < 2 or parts_split[1] not in include_exts:
-                continue  # Skip file if its extension is not in the include list
-        elif exclude_exts:
-            parts_split = path.rsplit('.', 1)
-            if len(parts_split) == 2 and parts_split[1] in exclude_exts:
+        if check_ext:
+            dot = path.rfind('.')
+            ext = path[dot + 1:] if dot >= 0 else None
+            if include_exts:
+                if ext not in include_exts:
+                    continue  # Skip file if its extension is not in the include list
+            elif ext in exclude_exts:
                 continue  # Skip file if its extension is in the exclude list
 
-        # Print a header line with the file path
-        print(f"# {path}", file=out)
+        paths.append(path)
+        sizes.append(size)
+
+    # The filesystem lists the repository root when created, which costs an
+    # API call, so it is only created once a file is read through it.
+    # If creating it fails, the error is kept and raised once by the output
+    # loop, rather than retried for every file.
+    fs = None
+    fs_error = None
+    fs_lock = threading.Lock()
 
-        # Open the file and print its contents with 5-digit, zero-padded line numbers
+    def fetch(path):
+        nonlocal fs, fs_error
+        with fs_lock:
+            if fs is None and fs_error is None:
+                try:
+                    # Imported here rather than at module level to keep CLI startup fast.
+                    from fsspec.implementations.github import GithubFileSystem
+                    fs = GithubFileSystem(org=org, repo=repo, sha=sha, token=token, username=username)
+                except Exception as e:
+                    fs_error = e
+        if fs_error is not None:
+            return None, fs_error
+        # cat_file reads the whole file with a single request.
         try:
-            with fs.open(path, 'r') as f:
-                for i, line in enumerate(f, start=1):
-                    print(f"{i:05d}| {line}", end='', file=out)
-                # Print a blank line after each file
-                print(file=out)
+            return fs.cat_file(path), None
         except Exception as e:
-            print(f"Error reading {path}: {e}", file=out)
+            return None, e
+
+    # The tarball holds every file in the repository, so it is only worth
+    # downloading when most of its bytes are wanted. Its size is unknown if an
+    # excluded directory was never listed.
+    use_tarball = False
+    if not subdir and len(paths) > TARBALL_THRESHOLD and None not in excluded:
+        repo_size = sum(entry[2] for entry in entries) + sum(excluded)
+        use_tarball = 2 * sum(sizes) >= repo_size
+
+    # Fetch file contents concurrently. Results are yielded in input order,
+    # so the output is identical to a serial crawl. Large whole-repository
+    # crawls stream the tarball; otherwise, with a token, contents are read
+    # in GraphQL batches, and without one through the REST API, one call per
+    # file.
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor, contextlib.ExitStack() as stack:
+        if use_tarball:
+            results = _read_files_tarball(org, repo, sha, paths, token, fetch, executor)
+        elif token:
+            results = _read_files_graphql(org, repo, sha, paths, token, fetch, executor, include_binary)
+        else:
+            results = _map_ordered(executor, fetch, paths)
+        # Close the reader before the executor shuts down if writing fails, so
+        # its queued downloads are cancelled rather than waited for.
+        stack.callback(results.close)
+        for path, size, (data, error) in zip(paths, sizes, results):
+            if error is not None and error is fs_error:
+                raise error
+            if data is _BINARY or (not include_binary and isinstance(data, bytes) and _is_binary(data)):
+                print(f"# {path} (binary, {size} bytes — skipped)", file=out)
+                continue
+            if isinstance(data, bytes):
+                errors = 'replace' if include_binary else 'strict'
+                try:
+                    data = _normalize_newlines(data.decode('utf-8', errors))
+                except UnicodeDecodeError as e:
+                    error = e
+
+            # Print a header line with the file path
+            print(f"# {path}", file=out)
+
+            if error is not None:
+                print(f"Error reading {path}: {error}", file=out)
+                continue
+
+            out.write(_format_numbered(data))
 
 def main():
     parser = argparse.ArgumentParser(
@@ -189,6 +648,24 @@ def main():
         default=None,
         help="Constrain the crawl to the specified directory (and its subdirectories), e.g., 'src'."
     )
+    parser.add_argument(
+        "--exclude_dirs",
+        nargs='*',
+        default=sorted(DEFAULT_EXCLUDE_DIRS),
+        help=("Directory names whose contents are skipped wherever they appear "
+              f"(default: {' '.join(sorted(DEFAULT_EXCLUDE_DIRS))}). "
+              "Pass the flag with no names to crawl every directory.")
+    )
+    parser.add_argument(
+        "--include_binary",
+        action="store_true",
+        help="Print the contents of binary files instead of skipping them."
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Look up the branch's latest commit instead of using one cached by a recent crawl."
+    )
 
     args = parser.parse_args()
 
@@ -218,24 +695,22 @@ def main():
             for d in reversed(missing_dirs):
                 logging.info(f"Creating directory: {d}")
                 os.mkdir(d)
-        with open(output_path, "w", encoding="utf-8") as out_file:
-            crawl_repo_files(
-                args.github_path,
-                include_exts=args.include,
-                exclude_exts=args.exclude,
-                token=args.token,
-                username=args.username,
-                out=out_file,
-                include_dir=args.include_dir
-            )
+        out_file = open(output_path, "w", encoding="utf-8", buffering=OUTPUT_BUFFER_SIZE)
     else:
+        out_file = contextlib.nullcontext(sys.stdout)
+
+    with out_file as out:
         crawl_repo_files(
             args.github_path,
             include_exts=args.include,
             exclude_exts=args.exclude,
             token=args.token,
             username=args.username,
-            include_dir=args.include_dir
+            out=out,
+            include_dir=args.include_dir,
+            include_binary=args.include_binary,
+            exclude_dirs=args.exclude_dirs,
+            ref_cache=not args.no_cache
         )
 
 if __name__ == "__main__":
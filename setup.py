@@ -12,6 +12,9 @@ setup(
         'fsspec>=2025,<2026',
         'requests>=2,<3',   
     ],
+    extras_require={
+        'fast': ['orjson>=3'],
+    },
     entry_points={
         'console_scripts': [
             'crawl-repo=repo_crawler.crawl:main',
@@ -0,0 +1,127 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+from fsspec.implementations.github import GithubFileSystem
+from repo_crawler.crawl import resolve_ref
+
+_MISSING = object()
+
+class FakeFS:
+    """
+    A fake filesystem to simulate fsspec's GitHubFileSystem for testing.
+    """
+    __slots__ = ("_blobs", "_by_subdir", "last_subdir", "last_listing")
+
+    def __init__(self, files):
+        """
+        Initialize FakeFS with a dictionary mapping file paths to tuples of (file_content, info_dict).
+        Example:
+            {
+                "file1.txt": ("hello\nworld\n", {'type': 'file'}),
+                "file2.svg": ("should be excluded", {'type': 'file'}),
+                "dir": ("", {'type': 'directory'}),
+            }
+        """
+        # File contents as served by cat_file, encoded once up front
+        self._blobs = {
+            path: content.encode()
+            for path, (content, info) in files.items()
+            if info['type'] == 'file'
+        }
+        # The listing of each directory ("" being the repository root), built
+        # once and shared by every caller
+        listings = {"": []}
+        for path, content in self._blobs.items():
+            entry = (path, None, len(content))
+            listings[""].append(entry)
+            parts = path.split("/")[:-1]
+            for depth in range(1, len(parts) + 1):
+                listings.setdefault("/".join(parts[:depth]), []).append(entry)
+        self._by_subdir = {subdir: tuple(entries) for subdir, entries in listings.items()}
+        self.last_subdir = None  # Record the last subdir listed
+        self.last_listing = None  # Record the (org, repo, ref, subdir) of the last listing
+
+    def list_tree(self, org, repo, ref, token=None, subdir="", exclude_dirs=frozenset(), excluded=None):
+        """
+        Stand-in for repo_crawler.crawl._list_tree: lists every file under
+        subdir, leaving out files inside directories named in exclude_dirs and
+        appending their sizes to excluded.
+        """
+        self.last_subdir = subdir
+        self.last_listing = (org, repo, ref, subdir)
+        entries = self._by_subdir.get(subdir, ())
+        if exclude_dirs:
+            start = len(subdir) + 1 if subdir else 0
+            kept = []
+            for entry in entries:
+                if exclude_dirs.isdisjoint(entry[0][start:].split("/")[:-1]):
+                    kept.append(entry)
+                elif excluded is not None:
+                    excluded.append(entry[2])
+            entries = tuple(kept)
+        return entries
+
+    def reset(self):
+        """Forget what the previous test listed."""
+        self.last_subdir = None
+        self.last_listing = None
+
+    def cat_file(self, path):
+        data = self._blobs.get(path, _MISSING)
+        if data is _MISSING:
+            raise FileNotFoundError(f"No such file: {path}")
+        return data
+
+@pytest.fixture(scope="session")
+def fake_fs_with_files():
+    """Fixture providing a FakeFS instance with test files, shared by the whole session."""
+    files = {
+        "file1.txt": ("hello\nworld\n", {'type': 'file'}),
+        "file2.svg": ("should be excluded", {'type': 'file'}),
+        "file3.py": ("print('hello')", {'type': 'file'}),
+        "dir": ("", {'type': 'directory'}),
+    }
+    return FakeFS(files)
+
+@pytest.fixture(autouse=True)
+def _reset_fake_fs(fake_fs_with_files):
+    """Clears the shared FakeFS's recorded listing before each test."""
+    fake_fs_with_files.reset()
+
+@pytest.fixture(scope="module", autouse=True)
+def _patch_crawl_env(fake_fs_with_files):
+    """
+    Points the crawl at fake_fs_with_files for a whole test module: the tree
+    listing and file reads are served by the fake, and every ref resolves to
+    the same SHA. Tests needing something else patch over it themselves.
+    """
+    with patch("repo_crawler.crawl.resolve_ref", new=lambda *a, **k: "0123abcd"), \
+            patch("repo_crawler.crawl._list_tree", new=fake_fs_with_files.list_tree), \
+            patch("fsspec.implementations.github.GithubFileSystem", new=lambda *a, **k: fake_fs_with_files):
+        yield
+
+@pytest.fixture
+def mocked_gh(monkeypatch):
+    """
+    Fixture replacing resolve_ref and GithubFileSystem with mocks, for tests
+    that assert how the crawl calls them. Returns (resolve_ref, GithubFileSystem).
+    """
+    verify = MagicMock(spec=resolve_ref, return_value="0123abcd")
+    fs_cls = MagicMock(spec=GithubFileSystem)
+    monkeypatch.setattr("repo_crawler.crawl.resolve_ref", verify)
+    monkeypatch.setattr("fsspec.implementations.github.GithubFileSystem", fs_cls)
+    return verify, fs_cls
+
+@pytest.fixture
+def install_fake_fs(monkeypatch):
+    """
+    Fixture returning a function that points the crawl at a FakeFS built from
+    the given files dict (see FakeFS.__init__) for the duration of a test, and
+    returns that FakeFS.
+    """
+    def install(files):
+        fake_fs = FakeFS(files)
+        monkeypatch.setattr("repo_crawler.crawl._list_tree", fake_fs.list_tree)
+        monkeypatch.setattr("fsspec.implementations.github.GithubFileSystem", lambda *a, **k: fake_fs)
+        return fake_fs
+    return install
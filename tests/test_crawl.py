@@ -1,285 +1,590 @@
 import pytest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 import io
+import json
 import re
 import sys
+import tarfile
+import time
 
-from repo_crawler.crawl import crawl_repo_files, main
-
-class FakeFS:
-    """
-    A fake filesystem to simulate fsspec's GitHubFileSystem for testing.
-    """
-    def __init__(self, files):
-        """
-        Initialize FakeFS with a dictionary mapping file paths to tuples of (file_content, info_dict).
-        Example:
-            {
-                "github://user/repo/branch/file1.txt": ("hello\nworld\n", {'type': 'file'}),
-                "github://user/repo/branch/file2.svg": ("should be excluded", {'type': 'file'}),
-                "github://user/repo/branch/dir": ("", {'type': 'directory'}),
-            }
-        """
-        self.files = files
-        self.last_glob = None  # Record the last glob pattern passed
-
-    def glob(self, pattern, recursive=False):
-        self.last_glob = pattern
-        # For testing, return all known paths regardless of the pattern.
-        return list(self.files.keys())
-
-    def info(self, path):
-        if path in self.files:
-            return self.files[path][1]
-        raise FileNotFoundError(f"No such file: {path}")
-
-    def open(self, path, mode='r'):
-        if path in self.files:
-            content = self.files[path][0]
-            return io.StringIO(content)
-        raise FileNotFoundError(f"No such file: {path}")
-
-@pytest.fixture
-def fake_fs_with_files():
-    """Fixture providing a FakeFS instance with test files."""
-    files = {
-        "github://user/repo/branch/file1.txt": ("hello\nworld\n", {'type': 'file'}),
-        "github://user/repo/branch/file2.svg": ("should be excluded", {'type': 'file'}),
-        "github://user/repo/branch/file3.py": ("print('hello')", {'type': 'file'}),
-        "github://user/repo/branch/dir": ("", {'type': 'directory'}),
-    }
-    return FakeFS(files)
+from repo_crawler.crawl import DEFAULT_EXCLUDE_DIRS, MAX_WORKERS, REQUEST_TIMEOUT, _format_numbered, _list_tree, crawl_repo_files, main, resolve_ref
 
-@patch("repo_crawler.crawl.verify_branch_exists", return_value=None)
-@patch("repo_crawler.crawl.GithubFileSystem")
-def test_include_dir_filtering(mock_filesystem, mock_verify):
+def test_include_dir_filtering(install_fake_fs):
     """
     Test that the --include_dir flag correctly limits the crawl to the specified directory.
     """
     # Set up a fake file system with files in different directories.
     files = {
-        "github://user/repo/branch/file1.txt": ("outside", {'type': 'file'}),
-        "github://user/repo/branch/src/file2.txt": ("inside", {'type': 'file'}),
-        "github://user/repo/branch/src/sub/file3.txt": ("inside sub", {'type': 'file'}),
-        "github://user/repo/branch/dir/file4.txt": ("outside dir", {'type': 'file'}),
+        "file1.txt": ("outside", {'type': 'file'}),
+        "src/file2.txt": ("inside", {'type': 'file'}),
+        "src/sub/file3.txt": ("inside sub", {'type': 'file'}),
+        "dir/file4.txt": ("outside dir", {'type': 'file'}),
     }
-    fake_fs = FakeFS(files)
-
-    # Override glob to simulate filtering by the include_dir.
-    def filtered_glob(pattern, recursive):
-        fake_fs.last_glob = pattern
-        # Assuming the pattern is like "src/**", we extract "src" and return only paths under that directory.
-        subdir = pattern[:-3]  # remove '/**'
-        filtered = []
-        for k in fake_fs.files.keys():
-            # The path format is "github://user/repo/branch/<subdir>/..."
-            parts = k.split("/")
-            if len(parts) > 5 and parts[5] == subdir:
-                filtered.append(k)
-        return filtered
-
-    fake_fs.glob = filtered_glob
-    mock_filesystem.return_value = fake_fs
+    fake_fs = install_fake_fs(files)
 
     # Run the crawl with include_dir set to "src"
     output_io = io.StringIO()
     crawl_repo_files("github://user/repo/branch", include_dir="src", out=output_io)
 
-    # Verify that the glob pattern was constructed as expected.
-    assert fake_fs.last_glob == "src/**"
+    # Verify that only the "src" subtree was listed.
+    assert fake_fs.last_subdir == "src"
 
     output = output_io.getvalue()
     # Check that only files under the "src" directory are processed.
-    assert "# github://user/repo/branch/src/file2.txt" in output
-    assert "# github://user/repo/branch/src/sub/file3.txt" in output
+    assert "# src/file2.txt" in output
+    assert "# src/sub/file3.txt" in output
     # Files outside the "src" directory should not appear.
     assert "file1.txt" not in output
     assert "dir/file4.txt" not in output
 
-# For tests that need a valid branch, we patch verify_branch_exists to do nothing.
-@patch("repo_crawler.crawl.verify_branch_exists", return_value=None)
-@patch("repo_crawler.crawl.GithubFileSystem")
-def test_path_transformation(mock_filesystem, mock_verify, fake_fs_with_files):
+def test_path_transformation(fake_fs_with_files):
     """
     Test that an input in the form "org/name" (without a prefix)
-    is transformed properly and that the glob pattern is correctly constructed.
+    is transformed properly and that the whole tree is listed.
     """
-    mock_filesystem.return_value = fake_fs_with_files
     # "repo-crawler/repo-crawler" will default to branch "main"
-    # To prevent the "no files" error, we simulate that FakeFS returns files.
+    # To prevent the "no files" error, we simulate that the fake returns files.
     crawl_repo_files("repo-crawler/repo-crawler", out=io.StringIO())
-    expected_pattern = "**"
-    assert fake_fs_with_files.last_glob == expected_pattern
+    assert fake_fs_with_files.last_listing == ("repo-crawler", "repo-crawler", "0123abcd", "")
 
-@patch("repo_crawler.crawl.verify_branch_exists", return_value=None)
-@patch("repo_crawler.crawl.GithubFileSystem")
-def test_valid_path_with_exclusion(mock_filesystem, mock_verify, fake_fs_with_files, capsys):
+def test_valid_path_with_exclusion():
     """
     Test that files with extensions in the exclusion list are skipped.
     """
-    mock_filesystem.return_value = fake_fs_with_files
-    crawl_repo_files("github://user/repo/branch", exclude_exts=['svg'])
-    captured = capsys.readouterr()
-    output = captured.out
+    output_io = io.StringIO()
+    crawl_repo_files("github://user/repo/branch", exclude_exts=['svg'], out=output_io)
+    output = output_io.getvalue()
 
-    # Ensure file1.txt and file3.py are processed, but file2.svg is excluded.
-    assert re.search(r"^# github://user/repo/branch/file1\.txt$", output, re.MULTILINE)
-    assert "file2.svg" not in output
-    assert "file3.py" in output
+    # Ensure file1.txt and file3.py are processed, in order, but file2.svg is excluded.
+    assert output.splitlines() == [
+        "# file1.txt",
+        "00001| hello",
+        "00002| world",
+        "",
+        "# file3.py",
+        "00001| print('hello')",
+    ]
 
-@patch("repo_crawler.crawl.verify_branch_exists", return_value=None)
-@patch("repo_crawler.crawl.GithubFileSystem")
-def test_valid_path_with_inclusion(mock_filesystem, mock_verify, fake_fs_with_files, capsys):
+def test_valid_path_with_inclusion():
     """
     Test that only files with extensions in the inclusion list are processed.
     """
-    mock_filesystem.return_value = fake_fs_with_files
-    crawl_repo_files("github://user/repo/branch", include_exts=['py'])
-    captured = capsys.readouterr()
-    output = captured.out
+    output_io = io.StringIO()
+    crawl_repo_files("github://user/repo/branch", include_exts=['py'], out=output_io)
+    output = output_io.getvalue()
+    lines = output.splitlines()
 
     # Only file3.py should be processed.
     assert "file1.txt" not in output
     assert "file2.svg" not in output
-    assert re.search(r"^# github://user/repo/branch/file3\.py$", output, re.MULTILINE)
-    assert re.search(r"^00001\| print\('hello'\)$", output, re.MULTILINE)
+    assert "# file3.py" in lines
+    assert "00001| print('hello')" in lines
 
-@patch("repo_crawler.crawl.verify_branch_exists", return_value=None)
-@patch("repo_crawler.crawl.GithubFileSystem")
-def test_branch_with_forward_slash_colon_syntax(mock_filesystem, mock_verify):
+@pytest.mark.parametrize("path, branch", [
+    # Branch name with a forward slash, using colon syntax
+    ("user/repo:feature/new-feature", "feature/new-feature"),
+    # No branch given: the default branch "main" is used
+    ("user/repo", "main"),
+    # Branch name with multiple forward slashes is preserved whole
+    ("user/repo:feature/sub-feature/final-name", "feature/sub-feature/final-name"),
+])
+def test_branch_parsing(mocked_gh, fake_fs_with_files, path, branch):
     """
-    Test that branch names with forward slashes work correctly with colon syntax.
+    Test that the branch is parsed from the path and resolved to the commit
+    SHA the filesystem is opened at.
     """
-    files = {
-        "feature/new-feature": ("feature content", {'type': 'file'}),
-    }
-    fake_fs = FakeFS(files)
-    mock_filesystem.return_value = fake_fs
+    mock_verify, mock_filesystem = mocked_gh
+    mock_filesystem.return_value = fake_fs_with_files
 
-    # Test branch name with forward slash using colon syntax
     output_io = io.StringIO()
-    crawl_repo_files("user/repo:feature/new-feature", out=output_io)
-    
-    # Verify that verify_branch_exists was called with the correct branch name
-    mock_verify.assert_called_with("user", "repo", "feature/new-feature", None)
-    
-    # Verify that GithubFileSystem was initialized with the correct parameters
-    mock_filesystem.assert_called_with(
-        org="user", 
-        repo="repo", 
-        sha="feature/new-feature", 
-        token=None, 
+    crawl_repo_files(path, out=output_io)
+
+    mock_verify.assert_called_once_with("user", "repo", branch, None, True)
+    mock_filesystem.assert_called_once_with(
+        org="user",
+        repo="repo",
+        sha="0123abcd",
+        token=None,
         username=None
     )
 
-@patch("repo_crawler.crawl.verify_branch_exists", return_value=None)
-@patch("repo_crawler.crawl.GithubFileSystem")
-def test_branch_with_forward_slash_github_syntax_limitation(mock_filesystem, mock_verify):
+def test_branch_with_forward_slash_github_syntax_limitation(mocked_gh, install_fake_fs):
     """
     Test that github:// syntax with forward slashes in branch names still works
     but the forward slash is interpreted as part of the path, not the branch name.
     This demonstrates the limitation of github:// syntax.
     """
+    mock_verify, _ = mocked_gh
     files = {
-        "feature": ("feature content", {'type': 'file'}),
+        "new-feature/README.md": ("feature content", {'type': 'file'}),
     }
-    fake_fs = FakeFS(files)
-    mock_filesystem.return_value = fake_fs
+    fake_fs = install_fake_fs(files)
 
     # Test github:// syntax - the "new-feature" part will be treated as a subdir
     output_io = io.StringIO()
     crawl_repo_files("github://user/repo/feature/new-feature", out=output_io)
     
     # Verify that the branch is interpreted as "feature" and subdir as "new-feature"
-    mock_verify.assert_called_with("user", "repo", "feature", None)
+    mock_verify.assert_called_once_with("user", "repo", "feature", None, True)
     
-    # Verify the glob pattern includes the subdir
-    assert fake_fs.last_glob == "new-feature/**"
+    # Verify the listing is constrained to the subdir
+    assert fake_fs.last_subdir == "new-feature"
 
-@patch("repo_crawler.crawl.verify_branch_exists", return_value=None)
-@patch("repo_crawler.crawl.GithubFileSystem")
-def test_default_main_branch(mock_filesystem, mock_verify, fake_fs_with_files):
+@pytest.mark.parametrize("path", [
+    # Path without org/repo structure
+    "invalid-path",
+    # Too many components in the org/repo part
+    "org/repo/extra:branch",
+])
+def test_invalid_path_format(path):
     """
-    Test that the default branch "main" is used when no branch is specified.
+    Test that invalid path formats raise appropriate errors.
     """
-    mock_filesystem.return_value = fake_fs_with_files
-    
+    with pytest.raises(ValueError, match="must be in format 'org/repo'"):
+        crawl_repo_files(path)
+
+def test_include_exclude_mutual_exclusivity(monkeypatch):
+    """
+    Verify that using both --include and --exclude flags results in an error.
+    This test simulates command-line arguments and expects a SystemExit.
+    """
+    test_args = ["prog", "github://user/repo/branch", "--include", "py", "--exclude", "txt"]
+    monkeypatch.setattr(sys, "argv", test_args)
+    with pytest.raises(SystemExit):
+        main()
+
+def _missing_ref(org, repo, ref, token=None, use_cache=True):
+    """Stand-in for resolve_ref when the ref does not exist."""
+    raise ValueError(f"Branch '{ref}' does not exist in repository '{org}/{repo}'.")
+
+@pytest.mark.parametrize("path, branch", [
+    ("github://user/repo/invalidbranch", "invalidbranch"),
+    # Branch names with forward slashes are reported whole
+    ("user/repo:feature/non-existent", "feature/non-existent"),
+])
+@patch("repo_crawler.crawl.resolve_ref", new=_missing_ref)
+def test_invalid_branch_error(path, branch):
+    """
+    Test that a ValueError with an appropriate message is raised
+    when the branch verification fails due to an invalid branch.
+    """
+    with pytest.raises(ValueError, match=re.escape(f"Branch '{branch}' does not exist in repository 'user/repo'.")):
+        crawl_repo_files(path)
+
+@pytest.mark.parametrize("exclude_dirs, expected", [
+    # Only directories that never hold source are skipped by default.
+    (DEFAULT_EXCLUDE_DIRS, ["# a.py", "# src/build/__init__.py", "# dist/setup.py"]),
+    (["src"], ["# a.py", "# dist/setup.py", "# node_modules/pkg/index.js"]),
+    ([], ["# a.py", "# src/build/__init__.py", "# dist/setup.py", "# node_modules/pkg/index.js"]),
+])
+def test_exclude_dirs(install_fake_fs, exclude_dirs, expected):
+    """
+    Test that exclude_dirs is passed through to the tree listing, so files in
+    the named directories are never read.
+    """
+    install_fake_fs({
+        "a.py": ("a", {'type': 'file'}),
+        "src/build/__init__.py": ("b", {'type': 'file'}),
+        "dist/setup.py": ("c", {'type': 'file'}),
+        "node_modules/pkg/index.js": ("d", {'type': 'file'}),
+    })
+
+    output_io = io.StringIO()
+    crawl_repo_files("user/repo", out=output_io, exclude_dirs=exclude_dirs)
+
+    headers = [line for line in output_io.getvalue().splitlines() if line.startswith("# ")]
+    assert headers == expected
+
+def test_concurrent_fetch_preserves_order(install_fake_fs, monkeypatch):
+    """
+    Test that files are printed in listing order even when their contents
+    arrive out of order from the concurrent fetch.
+    """
+    files = {
+        f"file{i}.txt": (f"content {i}\n", {'type': 'file'}) for i in range(8)
+    }
+    fake_fs = install_fake_fs(files)
+
+    class SlowFS:
+        def cat_file(self, path):
+            # Earlier files take longer, so they finish last.
+            time.sleep(0.01 * (8 - int(path[4])))
+            return fake_fs.cat_file(path)
+
+    monkeypatch.setattr("fsspec.implementations.github.GithubFileSystem", lambda *a, **k: SlowFS())
+
     output_io = io.StringIO()
     crawl_repo_files("user/repo", out=output_io)
-    
-    # Verify that the default branch "main" is used
-    mock_verify.assert_called_with("user", "repo", "main", None)
-    mock_filesystem.assert_called_with(
-        org="user", 
-        repo="repo", 
-        sha="main", 
-        token=None, 
-        username=None
+
+    headers = [line for line in output_io.getvalue().splitlines() if line.startswith("# ")]
+    assert headers == [f"# file{i}.txt" for i in range(8)]
+
+@pytest.mark.parametrize("use_tarball", [False, True])
+@patch("repo_crawler.crawl._session")
+def test_failed_write_stops_fetching(mock_session, install_fake_fs, monkeypatch, use_tarball):
+    """
+    Test that when writing the output fails (e.g. the pipe to `head` closes),
+    the crawl stops instead of downloading every remaining file, including
+    when the tarball download fails and files are read one by one.
+    """
+    if not use_tarball:
+        monkeypatch.setattr("repo_crawler.crawl.TARBALL_THRESHOLD", 1000)
+    mock_session.return_value.get.side_effect = ConnectionError("tarball unavailable")
+    fake_fs = install_fake_fs({f"file{i}.txt": ("x\n", {'type': 'file'}) for i in range(300)})
+    reads = []
+
+    class RecordingFS:
+        def __init__(self, **kwargs):
+            pass
+
+        def cat_file(self, path):
+            reads.append(path)
+            return fake_fs.cat_file(path)
+
+    class BrokenPipe:
+        def write(self, text):
+            raise BrokenPipeError
+
+    monkeypatch.setattr("fsspec.implementations.github.GithubFileSystem", RecordingFS)
+    with pytest.raises(BrokenPipeError):
+        crawl_repo_files("user/repo", out=BrokenPipe())
+
+    assert len(reads) <= 2 * MAX_WORKERS + 1
+    assert mock_session.return_value.get.called == use_tarball
+
+def test_filesystem_error_raised_once(install_fake_fs, monkeypatch):
+    """
+    Test that if the filesystem cannot be created, the crawl raises that
+    error once instead of retrying it for every file.
+    """
+    install_fake_fs({f"file{i}.txt": ("x\n", {'type': 'file'}) for i in range(20)})
+    attempts = []
+
+    def failing_filesystem(**kwargs):
+        attempts.append(kwargs)
+        raise PermissionError("Bad credentials")
+
+    monkeypatch.setattr("fsspec.implementations.github.GithubFileSystem", failing_filesystem)
+    with pytest.raises(PermissionError, match="Bad credentials"):
+        crawl_repo_files("user/repo", out=io.StringIO())
+
+    assert len(attempts) == 1
+
+@pytest.mark.parametrize("token, username", [("secret", None), (None, "user")])
+def test_token_requires_username(token, username):
+    """
+    Test that a token without a username, or the reverse, fails before
+    anything is read.
+    """
+    output_io = io.StringIO()
+    with pytest.raises(ValueError, match="both username and token"):
+        crawl_repo_files("user/repo", token=token, username=username, out=output_io)
+    assert output_io.getvalue() == ""
+
+def test_list_tree_shards_truncated_response():
+    """
+    Test that a truncated recursive listing falls back to listing each subtree
+    on its own, that excluded directories are never listed, and that paths
+    stay relative to the repository root.
+    """
+    trees = {
+        ("main:src", True): {"truncated": True, "tree": []},
+        ("main:src", False): {"truncated": False, "tree": [
+            {"path": "a.py", "type": "blob", "sha": "1", "size": 10},
+            {"path": "pkg", "type": "tree", "sha": "t1"},
+            {"path": "node_modules", "type": "tree", "sha": "t3"},
+            {"path": "vendored", "type": "commit", "sha": "c1"},
+        ]},
+        ("t1", True): {"truncated": False, "tree": [
+            {"path": "mod", "type": "tree", "sha": "t2"},
+            {"path": "mod/b.py", "type": "blob", "sha": "2", "size": 20},
+            {"path": "mod/__pycache__/b.pyc", "type": "blob", "sha": "3", "size": 30},
+        ]},
+    }
+
+    def fake_get(url, headers=None, params=None, timeout=None):
+        assert timeout == REQUEST_TIMEOUT
+        tree_sha = url.rsplit("/", 1)[1]
+        response = MagicMock(status_code=200)
+        response.content = json.dumps(trees[(tree_sha, params is not None)]).encode()
+        return response
+
+    with patch("repo_crawler.crawl._session") as mock_session:
+        mock_session.return_value.get.side_effect = fake_get
+        excluded = []
+        entries = _list_tree("user", "repo", "main", subdir="src", exclude_dirs=DEFAULT_EXCLUDE_DIRS, excluded=excluded)
+
+    assert entries == [
+        ("src/a.py", "1", 10),
+        ("src/pkg/mod/b.py", "2", 20),
+    ]
+    # The excluded .pyc was listed, but the size of node_modules is unknown.
+    assert excluded == [30, None]
+
+def test_resolve_ref_caches_sha(tmp_path, monkeypatch):
+    """
+    Test that a resolved commit SHA is served from the in-process and on-disk
+    caches instead of querying the GitHub API again.
+    """
+    # A str path works as well as a Path.
+    monkeypatch.setattr("repo_crawler.crawl.REF_CACHE_PATH", str(tmp_path / "cache" / "refs.json"))
+    monkeypatch.setattr("repo_crawler.crawl._resolved_refs", {})
+    response = MagicMock(status_code=200, text="0123abcd")
+
+    with patch("repo_crawler.crawl._session") as mock_session:
+        mock_get = mock_session.return_value.get
+        mock_get.return_value = response
+        assert resolve_ref("user", "repo", "main") == "0123abcd"
+        assert resolve_ref("user", "repo", "main") == "0123abcd"
+        # A fresh process only has the on-disk cache.
+        monkeypatch.setattr("repo_crawler.crawl._resolved_refs", {})
+        assert resolve_ref("user", "repo", "main") == "0123abcd"
+        # Full commit SHAs are returned without a lookup.
+        assert resolve_ref("user", "repo", "f" * 40) == "f" * 40
+
+    mock_get.assert_called_once()
+    assert mock_get.call_args[0][0].endswith("/repos/user/repo/commits/main")
+    assert mock_get.call_args[1]["timeout"] == REQUEST_TIMEOUT
+
+def test_resolve_ref_bypasses_cache(tmp_path, monkeypatch):
+    """
+    Test that with use_cache=False cached SHAs are ignored, on every call,
+    and replaced by the one the GitHub API returns.
+    """
+    cache_path = tmp_path / "refs.json"
+    cache_path.write_text(json.dumps({"user/repo:main": {"sha": "old", "time": time.time()}}))
+    monkeypatch.setattr("repo_crawler.crawl.REF_CACHE_PATH", cache_path)
+    monkeypatch.setattr("repo_crawler.crawl._resolved_refs", {})
+
+    with patch("repo_crawler.crawl._session") as mock_session:
+        mock_get = mock_session.return_value.get
+        mock_get.side_effect = [MagicMock(status_code=200, text=sha) for sha in ("new", "newer")]
+        assert resolve_ref("user", "repo", "main", use_cache=False) == "new"
+        assert resolve_ref("user", "repo", "main", use_cache=False) == "newer"
+        assert resolve_ref("user", "repo", "main") == "newer"
+
+    assert mock_get.call_count == 2
+    assert json.loads(cache_path.read_text())["user/repo:main"]["sha"] == "newer"
+
+def test_resolve_ref_cache_expires(tmp_path, monkeypatch):
+    """
+    Test that SHAs cached in memory expire after REF_CACHE_TTL seconds, like
+    the ones on disk.
+    """
+    monkeypatch.setattr("repo_crawler.crawl.REF_CACHE_PATH", tmp_path / "refs.json")
+    monkeypatch.setattr("repo_crawler.crawl._resolved_refs", {})
+    monkeypatch.setattr("repo_crawler.crawl.REF_CACHE_TTL", 0)
+
+    with patch("repo_crawler.crawl._session") as mock_session:
+        mock_get = mock_session.return_value.get
+        mock_get.side_effect = [MagicMock(status_code=200, text=sha) for sha in ("old", "new")]
+        assert resolve_ref("user", "repo", "main") == "old"
+        assert resolve_ref("user", "repo", "main") == "new"
+
+@pytest.mark.parametrize("error", [RuntimeError("no home"), KeyError("getpwuid(): uid not found")])
+def test_resolve_ref_without_home(monkeypatch, error):
+    """
+    Test that refs still resolve when there is no home directory to keep the
+    disk cache in, whichever error Path.home raises for it.
+    """
+    monkeypatch.delenv("XDG_CACHE_HOME", raising=False)
+    monkeypatch.setattr("pathlib.Path.home", MagicMock(side_effect=error))
+    monkeypatch.setattr("repo_crawler.crawl._resolved_refs", {})
+
+    with patch("repo_crawler.crawl._session") as mock_session:
+        mock_session.return_value.get.return_value = MagicMock(status_code=200, text="0123abcd")
+        assert resolve_ref("user", "repo", "main") == "0123abcd"
+
+@patch("repo_crawler.crawl._session")
+def test_graphql_batch_read_with_rest_fallback(mock_session, install_fake_fs):
+    """
+    Test that with a token, file contents are read through one GraphQL query
+    per batch, and files GraphQL cannot return as text, or returns as Git LFS
+    pointers, are read through the filesystem instead.
+    """
+    files = {
+        "a.py": ("from graphql\r\n", {'type': 'file'}),
+        "big.txt": ("from rest\n", {'type': 'file'}),
+        "lfs.txt": ("from lfs\n", {'type': 'file'}),
+    }
+    install_fake_fs(files)
+    response = MagicMock(status_code=200)
+    response.content = json.dumps({"data": {"repository": {
+        "f0": {"text": "from graphql\r\n", "isBinary": False, "isTruncated": False},
+        "f1": {"text": "from r", "isBinary": False, "isTruncated": True},
+        "f2": {"text": "version https://git-lfs.github.com/spec/v1\n", "isBinary": False, "isTruncated": False},
+    }}}).encode()
+    mock_session.return_value.post.return_value = response
+
+    output_io = io.StringIO()
+    crawl_repo_files("user/repo", token="secret", username="user", out=output_io)
+
+    mock_session.return_value.post.assert_called_once()
+    assert mock_session.return_value.post.call_args[1]["timeout"] == REQUEST_TIMEOUT
+    query = mock_session.return_value.post.call_args[1]["json"]["query"]
+    assert 'f0: object(expression: "0123abcd:a.py")' in query
+    assert output_io.getvalue() == (
+        "# a.py\n00001| from graphql\n\n"
+        "# big.txt\n00001| from rest\n\n"
+        "# lfs.txt\n00001| from lfs\n\n"
     )
 
-@patch("repo_crawler.crawl.verify_branch_exists", return_value=None)
-@patch("repo_crawler.crawl.GithubFileSystem")
-def test_complex_branch_name_with_multiple_slashes(mock_filesystem, mock_verify):
+@pytest.mark.parametrize("text, expected", [
+    ("hello\nworld\n", "00001| hello\n00002| world\n\n"),
+    ("hello\nworld", "00001| hello\n00002| world\n"),
+    ("\n", "00001| \n\n"),
+    ("", "\n"),
+    # Longer than the shared prefix table
+    ("x\n" * 5000, "".join(f"{i:05d}| x\n" for i in range(1, 5001)) + "\n"),
+])
+def test_format_numbered(text, expected):
+    """
+    Test that line numbering matches printing each line followed by a blank line.
+    """
+    assert _format_numbered(text) == expected
+
+@patch("repo_crawler.crawl._session")
+def test_tarball_read_with_rest_fallback(mock_session, install_fake_fs, monkeypatch):
     """
-    Test that branch names with multiple forward slashes work correctly.
+    Test that large whole-repository crawls read contents from the tarball,
+    in listing order, and read files missing from the archive, or archived as
+    Git LFS pointers, through the filesystem.
     """
+    monkeypatch.setattr("repo_crawler.crawl.TARBALL_THRESHOLD", 1)
     files = {
-        "complex": ("complex content", {'type': 'file'}),
+        "a.txt": ("from rest\n", {'type': 'file'}),
+        "b.txt": ("from tarball\n", {'type': 'file'}),
+        "c/d.txt": ("from tarball too\n", {'type': 'file'}),
+        "e.txt": ("from lfs\n", {'type': 'file'}),
+    }
+    install_fake_fs(files)
+    archived = {
+        "c/d.txt": files["c/d.txt"][0],
+        "b.txt": files["b.txt"][0],
+        "e.txt": "version https://git-lfs.github.com/spec/v1\noid sha256:0123\nsize 9\n",
     }
-    fake_fs = FakeFS(files)
-    mock_filesystem.return_value = fake_fs
 
-    # Test branch name with multiple forward slashes
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+        for path, content in archived.items():
+            data = content.encode()
+            member = tarfile.TarInfo(f"user-repo-0123abc/{path}")
+            member.size = len(data)
+            tar.addfile(member, io.BytesIO(data))
+    archive.seek(0)
+    response = MagicMock(raw=archive)
+    response.__enter__.return_value = response
+    mock_session.return_value.get.return_value = response
+
     output_io = io.StringIO()
-    crawl_repo_files("user/repo:feature/sub-feature/final-name", out=output_io)
-    
-    # Verify that the entire branch name is preserved
-    mock_verify.assert_called_with("user", "repo", "feature/sub-feature/final-name", None)
-    mock_filesystem.assert_called_with(
-        org="user", 
-        repo="repo", 
-        sha="feature/sub-feature/final-name", 
-        token=None, 
-        username=None
+    crawl_repo_files("user/repo", out=output_io)
+
+    assert mock_session.return_value.get.call_args[0][0].endswith("/repos/user/repo/tarball/0123abcd")
+    assert mock_session.return_value.get.call_args[1]["timeout"] == REQUEST_TIMEOUT
+    assert output_io.getvalue() == (
+        "# a.txt\n00001| from rest\n\n"
+        "# b.txt\n00001| from tarball\n\n"
+        "# c/d.txt\n00001| from tarball too\n\n"
+        "# e.txt\n00001| from lfs\n\n"
     )
 
-def test_invalid_path_format():
+@pytest.mark.parametrize("include_exts, use_tarball", [
+    (None, True),
+    # The selected files are a small share of the repository's bytes.
+    (["py"], False),
+])
+@patch("repo_crawler.crawl._session")
+def test_tarball_only_when_most_bytes_selected(mock_session, install_fake_fs, monkeypatch, include_exts, use_tarball):
     """
-    Test that invalid path formats raise appropriate errors.
+    Test that the tarball is only downloaded when the selected files make up
+    at least half of the repository's bytes.
     """
-    # Test path without org/repo structure
-    with pytest.raises(ValueError, match="must be in format 'org/repo'"):
-        crawl_repo_files("invalid-path")
-    
-    # Test path with too many components in org/repo part
-    with pytest.raises(ValueError, match="must be in format 'org/repo'"):
-        crawl_repo_files("org/repo/extra:branch")
+    monkeypatch.setattr("repo_crawler.crawl.TARBALL_THRESHOLD", 1)
+    install_fake_fs({
+        "a.py": ("a\n", {'type': 'file'}),
+        "b.py": ("b\n", {'type': 'file'}),
+        "assets.dat": ("x" * 100, {'type': 'file'}),
+    })
+    # An empty archive: every file is then read through the filesystem.
+    archive = io.BytesIO()
+    tarfile.open(fileobj=archive, mode="w:gz").close()
+    archive.seek(0)
+    response = MagicMock(raw=archive)
+    response.__enter__.return_value = response
+    mock_session.return_value.get.return_value = response
 
-def test_include_exclude_mutual_exclusivity(monkeypatch):
+    crawl_repo_files("user/repo", out=io.StringIO(), include_exts=include_exts)
+
+    assert mock_session.return_value.get.called == use_tarball
+
+@pytest.mark.parametrize("include_binary, expected", [
+    (False, "# logo.png (binary, 6 bytes — skipped)\n"),
+    (True, "# logo.png\n00001| \0\1PNG\n\n"),
+])
+def test_binary_files(install_fake_fs, include_binary, expected):
     """
-    Verify that using both --include and --exclude flags results in an error.
-    This test simulates command-line arguments and expects a SystemExit.
+    Test that binary files are skipped with a note unless include_binary is set.
     """
-    test_args = ["prog", "github://user/repo/branch", "--include", "py", "--exclude", "txt"]
-    monkeypatch.setattr(sys, "argv", test_args)
-    with pytest.raises(SystemExit):
-        main()
+    install_fake_fs({"logo.png": ("\0\1PNG\n", {'type': 'file'})})
+
+    output_io = io.StringIO()
+    crawl_repo_files("user/repo", out=output_io, include_binary=include_binary)
+
+    assert output_io.getvalue() == expected
 
-@patch("repo_crawler.crawl.verify_branch_exists", side_effect=ValueError("Branch 'invalidbranch' does not exist in repository 'user/repo'."))
-def test_invalid_branch_error(mock_verify):
+@pytest.mark.parametrize("include_binary, expected", [
+    (False, "# logo.png (binary, 6 bytes — skipped)\n"),
+    (True, "# logo.png\n00001| \0\1PNG\n\n"),
+])
+@patch("repo_crawler.crawl._session")
+def test_graphql_binary_files(mock_session, install_fake_fs, monkeypatch, include_binary, expected):
     """
-    Test that a ValueError with an appropriate message is raised
-    when the branch verification fails due to an invalid branch.
+    Test that files GraphQL reports as binary are skipped, using the size from
+    the tree listing, without being downloaded, or the filesystem being
+    created, unless include_binary is set.
     """
-    invalid_path = "github://user/repo/invalidbranch"
-    with pytest.raises(ValueError, match=r"Branch 'invalidbranch' does not exist in repository 'user/repo'."):
-        crawl_repo_files(invalid_path)
+    fake_fs = install_fake_fs({"logo.png": ("\0\1PNG\n", {'type': 'file'})})
+    created = []
+    reads = []
+
+    class RecordingFS:
+        def __init__(self, **kwargs):
+            created.append(kwargs)
+
+        def cat_file(self, path):
+            reads.append(path)
+            return fake_fs.cat_file(path)
 
-@patch("repo_crawler.crawl.verify_branch_exists", side_effect=ValueError("Branch 'feature/non-existent' does not exist in repository 'user/repo'."))
-def test_invalid_branch_with_slash_error(mock_verify):
+    monkeypatch.setattr("fsspec.implementations.github.GithubFileSystem", RecordingFS)
+    response = MagicMock(status_code=200)
+    response.content = json.dumps({"data": {"repository": {
+        "f0": {"text": None, "isBinary": True, "isTruncated": False},
+    }}}).encode()
+    mock_session.return_value.post.return_value = response
+
+    output_io = io.StringIO()
+    crawl_repo_files("user/repo", token="secret", username="user", out=output_io, include_binary=include_binary)
+
+    assert output_io.getvalue() == expected
+    assert len(created) == (1 if include_binary else 0)
+    assert reads == (["logo.png"] if include_binary else [])
+
+@pytest.mark.parametrize("use_output", [False, True])
+def test_main_crawls_once(monkeypatch, tmp_path, use_output):
     """
-    Test that branch validation works correctly for branch names with forward slashes.
+    Test that main runs a single crawl, writing either to stdout or to the
+    --output file.
     """
-    invalid_path = "user/repo:feature/non-existent"
-    with pytest.raises(ValueError, match=r"Branch 'feature/non-existent' does not exist in repository 'user/repo'."):
-        crawl_repo_files(invalid_path)
+    output_path = tmp_path / "out" / "scan.txt"
+    test_args = ["prog", "user/repo"] + (["--output", str(output_path)] if use_output else [])
+    monkeypatch.setattr(sys, "argv", test_args)
+
+    with patch("repo_crawler.crawl.crawl_repo_files") as mock_crawl:
+        mock_crawl.side_effect = lambda *a, out, **k: out.write("crawled\n")
+        main()
+
+    mock_crawl.assert_called_once()
+    if use_output:
+        assert output_path.read_text(encoding="utf-8") == "crawled\n"
+    else:
+        assert mock_crawl.call_args[1]["out"] is sys.stdout